@@ -0,0 +1,44 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tool"))
+import generate_indexes  # noqa: E402
+
+
+def test_write_index_matches_json_dumps(tmp_path):
+    files = ["DSC_2.jpg", "DSC_10.jpg", 'é "q".png']
+
+    generate_indexes.write_index(tmp_path, files, dry_run=False, verbose=False)
+
+    assert (tmp_path / "index.json").read_text(encoding="utf-8") == json.dumps(files, ensure_ascii=False, indent=2) + "\n"
+    assert (tmp_path / "index.js").read_text(encoding="utf-8").startswith("window.ALBUM_FILES = [\n")
+
+
+def test_write_index_removes_temp_files_on_failure(tmp_path, monkeypatch):
+    def failing_replace(src, dst):
+        raise OSError("replace failed")
+
+    monkeypatch.setattr(generate_indexes.os, "replace", failing_replace)
+
+    with pytest.raises(OSError):
+        generate_indexes.write_index(tmp_path, ["a.jpg"], dry_run=False, verbose=False)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_symlinked_photos_and_albums_are_indexed(tmp_path):
+    real = tmp_path / "real"
+    real.mkdir()
+    (real / "1.jpg").write_bytes(b"")
+    root = tmp_path / "photos"
+    album = root / "album"
+    album.mkdir(parents=True)
+    (album / "2.jpg").symlink_to(real / "1.jpg")
+    (root / "linked").symlink_to(real, target_is_directory=True)
+
+    assert generate_indexes.list_album_files(album) == ["2.jpg"]
+    assert sorted(p.name for p in generate_indexes.iter_albums(root, recursive=False)) == ["album", "linked"]
+    assert sorted(p.name for p in generate_indexes.iter_albums(root, recursive=True)) == ["album", "linked"]
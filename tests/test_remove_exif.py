@@ -0,0 +1,268 @@
+import errno
+import io
+import os
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+from PIL import TiffImagePlugin, TiffTags
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tool"))
+import remove_exif  # noqa: E402
+
+XMP_TAG = 700
+IPTC_TAG = 33723
+PHOTOSHOP_TAG = 34377
+
+
+def test_strip_tiff_removes_xmp_iptc_photoshop(tmp_path):
+    src = tmp_path / "photo.tif"
+    info = TiffImagePlugin.ImageFileDirectory_v2()
+    info[XMP_TAG] = b"<x:xmpmeta>secret</x:xmpmeta>"
+    info.tagtype[XMP_TAG] = TiffTags.BYTE
+    info[IPTC_TAG] = b"\x1c\x02\x78\x00\x06secret"
+    info.tagtype[IPTC_TAG] = TiffTags.UNDEFINED
+    info[PHOTOSHOP_TAG] = b"8BIM\x04\x04secret"
+    info.tagtype[PHOTOSHOP_TAG] = TiffTags.UNDEFINED
+    Image.new("RGB", (8, 8), "red").save(src, "TIFF", tiffinfo=info)
+    with Image.open(src) as im:
+        assert {XMP_TAG, IPTC_TAG, PHOTOSHOP_TAG} <= set(im.tag_v2)
+
+    ok, msg = remove_exif.strip_metadata(src, dry_run=False, backup=False)
+
+    assert ok, msg
+    with Image.open(src) as im:
+        assert not {XMP_TAG, IPTC_TAG, PHOTOSHOP_TAG} & set(im.tag_v2)
+
+
+def test_strip_jpeg_segments_drops_trailer_after_eoi():
+    exif = Image.Exif()
+    exif[0x010F] = "Camera"
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), "blue").save(buf, "JPEG", exif=exif.tobytes())
+    assert b"Exif\x00\x00" in buf.getvalue()
+    trailer = b"\x00\x00\x00\x18ftypmp42\xa9xyz+37.4219-122.0840/"
+    data = buf.getvalue() + trailer
+
+    stripped = remove_exif.strip_jpeg_segments(data)
+
+    assert stripped.endswith(b"\xff\xd9")
+    assert b"xyz+37.4219" not in stripped
+    assert b"Exif\x00\x00" not in stripped
+    with Image.open(io.BytesIO(stripped)) as im:
+        im.load()
+        assert im.size == (16, 16)
+
+
+def _rotated_jpeg(path, quality, **kwargs):
+    exif = Image.Exif()
+    exif[remove_exif.ORIENTATION_TAG] = 6
+    Image.new("RGB", (16, 8), "green").save(path, "JPEG", quality=quality, exif=exif.tobytes(), **kwargs)
+
+
+def test_strip_rotated_jpeg_keeps_source_tables_by_default(tmp_path):
+    src = tmp_path / "photo.jpg"
+    _rotated_jpeg(src, 60)
+    with Image.open(src) as im:
+        source_tables = im.quantization
+
+    ok, msg = remove_exif.strip_metadata(src, dry_run=False, backup=False)
+
+    assert ok, msg
+    with Image.open(src) as im:
+        assert im.size == (8, 16)
+        assert im.quantization == source_tables
+
+
+def test_strip_rotated_jpeg_explicit_quality_overrides_source_tables(tmp_path):
+    src = tmp_path / "photo.jpg"
+    _rotated_jpeg(src, 60)
+    with Image.open(src) as im:
+        source_tables = im.quantization
+
+    ok, msg = remove_exif.strip_metadata(src, dry_run=False, backup=False, jpeg_quality=95)
+
+    assert ok, msg
+    with Image.open(src) as im:
+        assert im.quantization != source_tables
+
+
+def test_strip_upright_jpeg_is_lossless(tmp_path):
+    src = tmp_path / "photo.jpg"
+    exif = Image.Exif()
+    exif[0x010F] = "Camera"
+    Image.radial_gradient("L").convert("RGB").save(src, "JPEG", quality=80, exif=exif.tobytes())
+    with Image.open(src) as im:
+        source_pixels = im.tobytes()
+
+    ok, msg = remove_exif.strip_metadata(src, dry_run=False, backup=False)
+
+    assert ok, msg
+    assert "lossless" in msg
+    with Image.open(src) as im:
+        assert not im.info.get("exif")
+        assert im.tobytes() == source_pixels
+
+
+def test_strip_rotated_jpeg_removes_comment(tmp_path):
+    src = tmp_path / "photo.jpg"
+    _rotated_jpeg(src, 90, comment=b"GPS secret")
+    assert b"GPS secret" in src.read_bytes()
+
+    ok, msg = remove_exif.strip_metadata(src, dry_run=False, backup=False)
+
+    assert ok, msg
+    assert b"GPS secret" not in src.read_bytes()
+
+
+def _jpeg_segment(marker, payload):
+    return bytes((0xFF, marker)) + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def _png_chunk(chunk_type, payload):
+    return struct.pack(">I", len(payload)) + chunk_type + payload + b"\0\0\0\0"
+
+
+def _webp(chunk):
+    return b"RIFF\0\0\0\0WEBP" + chunk
+
+
+PNG_HEAD = b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", b"\0" * 13) + _png_chunk(b"IDAT", b"\0" * 4)
+JPEG_SCAN = b"\xff\xda\x00\x02" + b"\x00" * 4 + b"\xff\xd9"
+
+
+def _probe(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return remove_exif.probe_metadata(path)
+
+
+def test_jpeg_exif_after_large_icc_segment(tmp_path):
+    icc = _jpeg_segment(0xE2, b"ICC_PROFILE\0" + b"\0" * 65000)
+    data = b"\xff\xd8" + icc + _jpeg_segment(0xE1, b"Exif\0\0MM") + JPEG_SCAN
+    assert _probe(tmp_path, "a.jpg", data) is True
+
+
+def test_jpeg_without_exif(tmp_path):
+    data = b"\xff\xd8" + _jpeg_segment(0xE0, b"JFIF\0") + JPEG_SCAN
+    assert _probe(tmp_path, "a.jpg", data) is False
+
+
+def test_png_exif_after_idat(tmp_path):
+    data = PNG_HEAD + _png_chunk(b"eXIf", b"MM") + _png_chunk(b"IEND", b"")
+    assert _probe(tmp_path, "a.png", data) is True
+
+
+def test_png_text_only(tmp_path):
+    data = PNG_HEAD + _png_chunk(b"tEXt", b"Author\0me") + _png_chunk(b"IEND", b"")
+    assert _probe(tmp_path, "a.png", data) is True
+
+
+def test_png_without_metadata(tmp_path):
+    assert _probe(tmp_path, "a.png", PNG_HEAD + _png_chunk(b"IEND", b"")) is False
+
+
+@pytest.mark.parametrize("flags", [0x08, 0x04])
+def test_webp_vp8x_with_exif_or_xmp_flag(tmp_path, flags):
+    data = _webp(b"VP8X\x0a\0\0\0" + bytes((flags,)) + b"\0" * 9)
+    assert _probe(tmp_path, "a.webp", data) is True
+
+
+@pytest.mark.parametrize("chunk", [b"VP8 ", b"VP8L"])
+def test_webp_simple_format(tmp_path, chunk):
+    assert _probe(tmp_path, "a.webp", _webp(chunk + b"\0" * 10)) is False
+
+
+@pytest.mark.parametrize("name", ["a.jpg", "a.png", "a.webp"])
+def test_wrong_magic_falls_through(tmp_path, name):
+    assert _probe(tmp_path, name, b"not an image at all, just text") is True
+
+
+def test_truncated_webp_falls_through(tmp_path):
+    assert _probe(tmp_path, "a.webp", _webp(b"VP8X")) is True
+
+
+def _require_user_xattrs(path):
+    if not hasattr(os, "setxattr"):
+        pytest.skip("os.setxattr not available")
+    try:
+        os.setxattr(path, "user.probe", b"1")
+    except OSError as e:
+        if e.errno in (errno.ENOTSUP, errno.EOPNOTSUPP):
+            pytest.skip("filesystem does not support user xattrs")
+        raise
+
+
+def _exif_jpeg(path):
+    exif = Image.Exif()
+    exif[0x010F] = "Camera"
+    Image.new("RGB", (8, 8), "red").save(path, "JPEG", exif=exif.tobytes())
+
+
+def _run_main(monkeypatch, capsys, *args):
+    monkeypatch.setattr(sys, "argv", ["remove_exif.py", "--jobs", "1", *args])
+    code = remove_exif.main()
+    return code, capsys.readouterr().out
+
+
+def test_mark_stripped_tracks_mtime(tmp_path):
+    src = tmp_path / "photo.jpg"
+    _exif_jpeg(src)
+    _require_user_xattrs(src)
+
+    assert not remove_exif.is_marked_stripped(src)
+    remove_exif.mark_stripped(src)
+    assert remove_exif.is_marked_stripped(src)
+
+    st = src.stat()
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert not remove_exif.is_marked_stripped(src)
+
+
+def test_main_skips_marked_files_unless_forced(tmp_path, monkeypatch, capsys):
+    src = tmp_path / "photo.jpg"
+    _exif_jpeg(src)
+    _require_user_xattrs(src)
+
+    code, out = _run_main(monkeypatch, capsys, "--root", str(tmp_path))
+    assert code == 0
+    assert "Processed: 1," in out
+    assert remove_exif.is_marked_stripped(src)
+
+    code, out = _run_main(monkeypatch, capsys, "--root", str(tmp_path))
+    assert "Processed: 0," in out
+    assert "skipped (already stripped): 1" in out
+
+    code, out = _run_main(monkeypatch, capsys, "--root", str(tmp_path), "--force")
+    assert "Processed: 1," in out
+    assert "skipped (already stripped): 0" in out
+
+
+def test_main_does_not_mark_errors_or_dry_runs(tmp_path, monkeypatch, capsys):
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not a jpeg")
+    _require_user_xattrs(bad)
+    good = tmp_path / "good.jpg"
+    _exif_jpeg(good)
+
+    code, out = _run_main(monkeypatch, capsys, "--root", str(tmp_path), "--dry-run")
+    assert "errors: 1" in out
+    assert not remove_exif.is_marked_stripped(good)
+    assert not remove_exif.is_marked_stripped(bad)
+
+    code, out = _run_main(monkeypatch, capsys, "--root", str(tmp_path))
+    assert code == 2
+    assert remove_exif.is_marked_stripped(good)
+    assert not remove_exif.is_marked_stripped(bad)
+
+
+@pytest.mark.parametrize("jobs", ["0", "-2"])
+def test_main_rejects_non_positive_jobs(tmp_path, monkeypatch, capsys, jobs):
+    monkeypatch.setattr(sys, "argv", ["remove_exif.py", "--root", str(tmp_path), "--jobs", jobs])
+    with pytest.raises(SystemExit) as exc:
+        remove_exif.main()
+    assert exc.value.code == 2
+    assert "must be at least 1" in capsys.readouterr().err
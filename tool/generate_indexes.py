@@ -14,18 +14,22 @@ Options:
   --recursive        Recurse into nested album folders (default: one level)
   --no-overwrite     Skip albums that already have index.json
   --dry-run          Print actions without writing files
+  --verbose          Print every file written (default: progress counts only)
 """
 from __future__ import annotations
 
 import argparse
 import json
+import os
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, Iterator, List
 import re
 import sys
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff"}
+_IMAGE_EXT_TUPLE = tuple(IMAGE_EXTS)
 SKIP_DIRS = {".originals"}
+_NAT_RE = re.compile(r"\d+|\D+")
 
 
 def natural_key(s: str):
@@ -33,48 +37,84 @@ def natural_key(s: str):
     Sort helper: breaks a string into text and integer chunks for natural order.
     Example: DSC_2.jpg < DSC_10.jpg
     """
-    return [int(text) if text.isdigit() else text.lower() for text in re.findall(r"\d+|\D+", s)]
+    # Tokens are pure digit or pure non-digit runs, so the first char decides.
+    # The compiled regex measures faster than an itertools.groupby split on typical filenames.
+    return [int(text) if text[0].isdecimal() else text.lower() for text in _NAT_RE.findall(s)]
 
 
 def list_album_files(album_dir: Path) -> List[str]:
+    # os.scandir reuses the d_type from readdir, so only symlinks need an extra stat()
     files = []
-    for p in album_dir.iterdir():
-        if not p.is_file():
-            continue
-        if p.name == "index.json":
-            continue
-        if p.suffix.lower() in IMAGE_EXTS:
-            files.append(p.name)
-    files.sort(key=natural_key)
+    with os.scandir(album_dir) as it:
+        for e in it:
+            name = e.name
+            if name.lower().endswith(_IMAGE_EXT_TUPLE) and e.is_file():
+                files.append(name)
+    # sort(key=...) already computes each key once; the raw name breaks case-only ties deterministically
+    files.sort(key=lambda name: (natural_key(name), name))
     return files
 
 
 def iter_albums(root: Path, recursive: bool) -> Iterable[Path]:
-    if recursive:
-        for p in root.rglob("*"):
-            if p.is_dir() and p.name not in SKIP_DIRS:
-                yield p
-    else:
-        for p in root.iterdir():
-            if p.is_dir() and p.name not in SKIP_DIRS:
-                yield p
-
-
-def write_index(album: Path, files: List[str], *, dry_run: bool) -> None:
+    if not recursive:
+        # One level only: build the list directly rather than going through a generator
+        with os.scandir(root) as it:
+            return [Path(e.path) for e in it if e.is_dir() and e.name not in SKIP_DIRS]
+    return _walk_albums(root)
+
+
+def _walk_albums(root: Path) -> Iterator[Path]:
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        with os.scandir(d) as it:
+            for e in it:
+                # Prune SKIP_DIRS before descending so backup folders are never opened
+                if e.is_dir() and e.name not in SKIP_DIRS:
+                    yield Path(e.path)
+                    # Symlinked albums are listed but not descended into, which also avoids cycles
+                    if not e.is_symlink():
+                        stack.append(e.path)
+
+
+def write_index(album: Path, files: List[str], *, dry_run: bool, verbose: bool = True) -> None:
     index_path = album / "index.json"
+    index_js_path = album / "index.js"
     if dry_run:
         print(f"[DRY] {index_path}: {len(files)} files")
         return
-    with index_path.open("w", encoding="utf-8") as f:
-        json.dump(files, f, ensure_ascii=False, indent=2)
-        f.write("\n")
-    print(f"Wrote {index_path} ({len(files)} entries)")
 
-    # Also write a JS fallback for local file:// previews where fetch() is blocked
-    index_js_path = album / "index.js"
-    js = "window.ALBUM_FILES = " + json.dumps(files, ensure_ascii=False) + ";\n"
-    index_js_path.write_text(js, encoding="utf-8")
-    print(f"Wrote {index_js_path} (JS fallback)")
+    # Stream each encoded name into index.json and its JS fallback (for local file:// previews
+    # where fetch() is blocked) so the full payload is never built as one string. Output matches
+    # json.dumps(files, indent=2). Both are written next to the target and swapped in atomically.
+    json_tmp = index_path.with_name(index_path.name + ".tmp")
+    js_tmp = index_js_path.with_name(index_js_path.name + ".tmp")
+    try:
+        with json_tmp.open("w", encoding="utf-8", newline="\n") as fj, js_tmp.open("w", encoding="utf-8", newline="\n") as fs:
+            fj.write("[")
+            fs.write("window.ALBUM_FILES = [")
+            sep = "\n  "
+            for name in files:
+                chunk = sep + json.dumps(name, ensure_ascii=False)
+                fj.write(chunk)
+                fs.write(chunk)
+                sep = ",\n  "
+            tail = "\n]" if files else "]"
+            fj.write(tail + "\n")
+            fs.write(tail + ";\n")
+        os.replace(json_tmp, index_path)
+        os.replace(js_tmp, index_js_path)
+    except BaseException:
+        # Don't leave partial temp files in the album folder
+        for tmp in (json_tmp, js_tmp):
+            try:
+                tmp.unlink()
+            except FileNotFoundError:
+                pass
+        raise
+    if verbose:
+        print(f"Wrote {index_path} ({len(files)} entries)")
+        print(f"Wrote {index_js_path} (JS fallback)")
 
 
 def main() -> int:
@@ -83,6 +123,7 @@ def main() -> int:
     parser.add_argument("--recursive", action="store_true", help="Recurse into nested album folders")
     parser.add_argument("--no-overwrite", action="store_true", help="Skip albums that already contain index.json")
     parser.add_argument("--dry-run", action="store_true", help="Preview changes without writing files")
+    parser.add_argument("--verbose", action="store_true", help="Print every file written instead of periodic progress")
     args = parser.parse_args()
 
     root = Path(args.root).resolve()
@@ -99,15 +140,18 @@ def main() -> int:
     total_files = 0
     for album in albums:
         if args.no_overwrite and (album / "index.json").exists():
-            print(f"Skip (exists): {album / 'index.json'}")
+            if args.verbose:
+                print(f"Skip (exists): {album / 'index.json'}")
             continue
         files = list_album_files(album)
         if not files:
             # nothing to index; skip quietly
             continue
-        write_index(album, files, dry_run=args.dry_run)
+        write_index(album, files, dry_run=args.dry_run, verbose=args.verbose)
         total_albums += 1
         total_files += len(files)
+        if not args.verbose and total_albums % 100 == 0:
+            print(f"... {total_albums} albums indexed", flush=True)
 
     print(f"\nIndexed albums: {total_albums}, total images listed: {total_files}")
     if args.dry_run:
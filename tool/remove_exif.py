@@ -7,53 +7,245 @@ Usage:
   python3 tool/remove_exif.py --dry-run     # Show what would be changed
   python3 tool/remove_exif.py --backup      # Save originals next to images under .originals/
   python3 tool/remove_exif.py --root PATH   # Process a custom photos root
+  python3 tool/remove_exif.py --jobs 4      # Limit the number of worker processes
+  python3 tool/remove_exif.py --verbose     # Print a line per file instead of periodic progress
+  python3 tool/remove_exif.py --prefetch    # Read files ahead of the workers (helps on network shares)
+  python3 tool/remove_exif.py --force       # Reprocess files already marked as stripped
 
 Notes:
 - Uses Pillow only. We recreate files without EXIF; for JPEG we also auto-apply EXIF orientation.
+- JPEGs that need no rotation are stripped losslessly by dropping metadata segments (no re-encode).
 - Keeps ICC profiles to preserve color where available.
+- Images are processed in parallel across worker processes (one per CPU by default).
+- On Linux, processed files are tagged with a user.exif_stripped xattr holding their mtime, and
+  unchanged tagged files are skipped on later runs. Without xattr support every file is processed.
 """
 
 from __future__ import annotations
 
 import argparse
+import functools
+import io
 import os
+import shutil
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, Tuple
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple
 
 try:
-    from PIL import Image, ImageOps
+    from PIL import Image, ImageOps, JpegImagePlugin
 except Exception as exc:
     print("This tool requires Pillow. Install with:\n\n  pip install -r tool/requirements.txt\n", file=sys.stderr)
     raise
 
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff"}
+_IMAGE_EXT_TUPLE = tuple(IMAGE_EXTENSIONS)
+SKIP_DIRS = {".originals"}
+ORIENTATION_TAG = 0x0112
+STRIPPED_XATTR = "user.exif_stripped"
 
 
 def iter_image_files(root: Path) -> Iterable[Path]:
-    for path in root.rglob("*"):
-        if not path.is_file():
-            continue
-        if path.suffix.lower() in IMAGE_EXTENSIONS:
-            yield path
+    # os.scandir reuses the d_type from readdir; backup folders are pruned so they are never re-stripped
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    if e.name not in SKIP_DIRS:
+                        stack.append(e.path)
+                elif e.name.lower().endswith(_IMAGE_EXT_TUPLE) and e.is_file(follow_symlinks=False):
+                    yield Path(e.path)
+
+
+def is_marked_stripped(path: Path) -> bool:
+    """True if path carries our xattr and hasn't been modified since it was set."""
+    if not hasattr(os, "getxattr"):
+        return False
+    try:
+        return os.getxattr(path, STRIPPED_XATTR) == str(os.stat(path).st_mtime_ns).encode()
+    except OSError:
+        return False
+
+
+def mark_stripped(path: Path) -> None:
+    if not hasattr(os, "setxattr"):
+        return
+    try:
+        os.setxattr(path, STRIPPED_XATTR, str(os.stat(path).st_mtime_ns).encode())
+    except OSError:
+        # Filesystem without user xattrs; the file is simply reprocessed next time
+        pass
 
 
-def make_backup_path(original: Path, backup_root: Path) -> Path:
-    relative = original.relative_to(backup_root.parent) if str(original).startswith(str(backup_root.parent)) else original.name
+# Backup dirs already created by this process, so each album costs one mkdir
+_created_backup_dirs = set()
+
+
+def make_backup_path(src: str) -> str:
     # Place alongside original under ".originals" directory at the album root
-    album_root = original.parent
-    dst_dir = album_root / ".originals"
-    dst_dir.mkdir(exist_ok=True)
-    return dst_dir / original.name
+    dst_dir = os.path.join(os.path.dirname(src), ".originals")
+    if dst_dir not in _created_backup_dirs:
+        os.makedirs(dst_dir, exist_ok=True)
+        _created_backup_dirs.add(dst_dir)
+    return os.path.join(dst_dir, os.path.basename(src))
+
+
+def backup_original(src: Path) -> None:
+    src_str = os.fspath(src)
+    backup_path = make_backup_path(src_str)
+    if not os.path.exists(backup_path):
+        # A hardlink keeps the original inode alive once tmp_path replaces src; copy where links aren't supported
+        try:
+            os.link(src_str, backup_path)
+        except (OSError, NotImplementedError):
+            shutil.copyfile(src_str, backup_path)
+
+
+# JPEG marker segments that carry metadata: APP1 (EXIF/XMP), APP13 (IPTC/Photoshop), COM
+JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}
+
+
+def strip_jpeg_segments(data: bytes) -> bytes:
+    """
+    Drop metadata marker segments from a JPEG stream without touching the
+    entropy-coded image data. Everything from SOS onward is copied verbatim.
+    """
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("not a JPEG stream")
+    out = [data[:2]]
+    i = 2
+    n = len(data)
+    while i < n:
+        if data[i] != 0xFF:
+            raise ValueError(f"bad JPEG marker at offset {i}")
+        # Skip fill bytes
+        while i < n and data[i] == 0xFF:
+            i += 1
+        if i >= n:
+            break
+        marker = data[i]
+        i += 1
+        # Standalone markers have no length field
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            out.append(bytes((0xFF, marker)))
+            continue
+        if marker == 0xD9:
+            out.append(b"\xff\xd9")
+            break
+        seg_len = int.from_bytes(data[i:i + 2], "big")
+        seg_end = i + seg_len
+        if marker == 0xDA:
+            # Start of scan: copy image data up to EOI and drop any trailer (e.g. motion-photo MP4).
+            # Byte stuffing guarantees FF D9 can't occur inside entropy-coded data.
+            eoi = data.find(b"\xff\xd9", i)
+            out.append(b"\xff\xda")
+            out.append(data[i:] if eoi == -1 else data[i:eoi + 2])
+            break
+        if marker not in JPEG_METADATA_MARKERS:
+            out.append(bytes((0xFF, marker)))
+            out.append(data[i:seg_end])
+        i = seg_end
+    return b"".join(out)
+
+
+PNG_METADATA_CHUNKS = {b"eXIf", b"tEXt", b"zTXt", b"iTXt"}
+
+
+def _jpeg_has_exif(f: BinaryIO) -> bool:
+    if f.read(2) != b"\xff\xd8":
+        return True
+    while True:
+        head = f.read(4)
+        if len(head) < 4 or head[0] != 0xFF:
+            return True  # unexpected layout; let Pillow decide
+        marker = head[1]
+        if marker in (0xDA, 0xD9):
+            return False
+        seg_len = int.from_bytes(head[2:4], "big")
+        if marker == 0xE1:
+            if f.read(6) == b"Exif\x00\x00":
+                return True
+            f.seek(seg_len - 8, os.SEEK_CUR)
+        else:
+            f.seek(seg_len - 2, os.SEEK_CUR)
+
+
+def _png_has_metadata(f: BinaryIO) -> bool:
+    if f.read(8) != b"\x89PNG\r\n\x1a\n":
+        return True
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return False
+        chunk_type = head[4:8]
+        if chunk_type in PNG_METADATA_CHUNKS:
+            return True
+        if chunk_type == b"IEND":
+            return False
+        # Skip chunk data and CRC
+        f.seek(int.from_bytes(head[:4], "big") + 4, os.SEEK_CUR)
+
+
+def _webp_has_metadata(f: BinaryIO) -> bool:
+    head = f.read(21)
+    if len(head) < 21 or head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return True
+    # Only the extended (VP8X) format can carry metadata; its flags say whether EXIF/XMP are present
+    if head[12:16] != b"VP8X":
+        return False
+    return bool(head[20] & 0x0C)
 
 
-def strip_metadata(src: Path, *, dry_run: bool, backup: bool, jpeg_quality: int = 95) -> Tuple[bool, str]:
+def probe_metadata(src: Path, data: Optional[bytes] = None) -> Optional[bool]:
+    """
+    Cheaply check whether an image carries EXIF/text metadata by walking its
+    container headers, without handing it to Pillow.
+    Returns None when the format isn't covered by a probe.
+    """
+    ext = src.suffix.lower()
+    if ext in (".jpg", ".jpeg"):
+        probe = _jpeg_has_exif
+    elif ext == ".png":
+        probe = _png_has_metadata
+    elif ext == ".webp":
+        probe = _webp_has_metadata
+    else:
+        return None
+    if data is not None:
+        return probe(io.BytesIO(data))
+    with open(src, "rb") as f:
+        return probe(f)
+
+
+def strip_metadata(
+    src: Path,
+    *,
+    dry_run: bool,
+    backup: bool,
+    jpeg_quality: Optional[int] = None,
+    optimize: bool = False,
+    data: Optional[bytes] = None,
+) -> Tuple[bool, str]:
     """
     Returns (changed, message)
+    If data is given it is used as the already-read contents of src.
     """
     try:
-        with Image.open(src) as im:
+        # Skip files with nothing to strip before paying for Image.open
+        if probe_metadata(src, data) is False:
+            return True, f"Already clean (no EXIF): {src}"
+
+        # Read once and let Pillow work from memory, so src is never held open when it is replaced
+        if data is None:
+            data = src.read_bytes()
+
+        with Image.open(io.BytesIO(data)) as im:
             icc = im.info.get("icc_profile")
             fmt = (im.format or "").upper()
 
@@ -61,11 +253,34 @@ def strip_metadata(src: Path, *, dry_run: bool, backup: bool, jpeg_quality: int
             if fmt in ("JPG", "JPEG") and not im.info.get("exif"):
                 return True, f"Already clean (no EXIF): {src}"
 
-            # Normalize orientation based on EXIF (prevents rotated output after EXIF removal)
-            im = ImageOps.exif_transpose(im)
+            # Save to a temporary path, then atomically replace
+            tmp_path = src.with_suffix(src.suffix + ".tmp_nox")
+
+            # JPEG, WebP and TIFF only parse their EXIF/tags here. PNG decodes the image when no eXIf chunk
+            # precedes IDAT, since one may follow it; that decode is needed for a correct orientation.
+            orientation = im.getexif().get(ORIENTATION_TAG, 1)
 
-            # Work on a copy to avoid altering the original stream in place
-            out = im.copy()
+            # Upright JPEGs don't need a pixel rotation, so drop the metadata segments losslessly
+            if fmt in ("JPG", "JPEG") and orientation == 1:
+                if dry_run:
+                    return True, f"[DRY] would strip EXIF: {src}"
+                if backup:
+                    backup_original(src)
+                tmp_path.write_bytes(strip_jpeg_segments(data))
+                tmp_path.replace(src)
+                return True, f"Stripped EXIF (lossless): {src}"
+
+            # Capture the source encoding before transposing; "keep" can't be used on the rotated copy
+            qtables = getattr(im, "quantization", None) if fmt in ("JPG", "JPEG") else None
+            subsampling = JpegImagePlugin.get_sampling(im) if qtables else -1
+
+            # Normalize orientation based on EXIF (prevents rotated output after EXIF removal).
+            # exif_transpose copies the whole image even when there is nothing to rotate, so skip it then.
+            if orientation != 1:
+                im = ImageOps.exif_transpose(im)
+            elif fmt in ("TIFF", "TIF"):
+                # The TIFF writer copies XMP/IPTC/Photoshop tags from a source TiffImageFile; save a detached copy
+                im = im.copy()
 
             # Build save params
             save_kwargs = {}
@@ -73,10 +288,18 @@ def strip_metadata(src: Path, *, dry_run: bool, backup: bool, jpeg_quality: int
                 save_kwargs["icc_profile"] = icc
             if fmt in ("JPG", "JPEG"):
                 fmt = "JPEG"
-                save_kwargs["quality"] = jpeg_quality
-                save_kwargs["optimize"] = True
-                # Ensure no EXIF is carried through
+                # Reuse the source tables to avoid quality drift unless a quality was asked for explicitly
+                if jpeg_quality is None and qtables:
+                    save_kwargs["qtables"] = qtables
+                else:
+                    save_kwargs["quality"] = 95 if jpeg_quality is None else jpeg_quality
+                if subsampling != -1:
+                    save_kwargs["subsampling"] = subsampling
+                # Huffman optimization is a second encode pass for a small size win
+                save_kwargs["optimize"] = optimize
+                # Ensure no EXIF or COM comment is carried through (the writer falls back to im.info)
                 save_kwargs["exif"] = b""
+                save_kwargs["comment"] = b""
             elif fmt in ("PNG",):
                 fmt = "PNG"
                 # Ensure no exif/pnginfo carried
@@ -87,31 +310,79 @@ def strip_metadata(src: Path, *, dry_run: bool, backup: bool, jpeg_quality: int
             elif fmt in ("TIFF", "TIF"):
                 fmt = "TIFF"
 
-            # Save to a temporary path, then atomically replace
-            tmp_path = src.with_suffix(src.suffix + ".tmp_nox")
-
             if dry_run:
                 return True, f"[DRY] would strip EXIF: {src}"
 
             if backup:
-                backup_path = make_backup_path(src, src.parent)
-                if not backup_path.exists():
-                    backup_path.write_bytes(src.read_bytes())
+                backup_original(src)
 
             # Always remove EXIF by not including any metadata other than ICC
-            out.save(tmp_path, fmt, **save_kwargs)
+            # Saving goes to tmp_path, so the source stream is never altered in place
+            im.save(tmp_path, fmt, **save_kwargs)
             tmp_path.replace(src)
             return True, f"Stripped EXIF: {src}"
     except Exception as e:
         return False, f"ERROR processing {src}: {e}"
 
 
+def iter_pooled(
+    paths: List[Path], worker: Callable[..., Tuple[bool, str]], jobs: Optional[int]
+) -> Iterator[Tuple[bool, str]]:
+    # Each image is independent, so fan out across processes; chunksize amortizes IPC overhead
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        yield from ex.map(worker, paths, chunksize=8)
+
+
+def _read_or_none(path: Path) -> Optional[bytes]:
+    # Read errors are reported by the worker when it retries by path
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
+
+
+def iter_prefetched(
+    paths: List[Path], worker: Callable[..., Tuple[bool, str]], jobs: Optional[int]
+) -> Iterator[Tuple[bool, str]]:
+    """
+    Overlap disk and CPU: a thread pool reads files ahead into a bounded window
+    while worker processes strip the bytes. Results are yielded in input order.
+    """
+    window = 2 * (jobs or os.cpu_count() or 1)
+    it = iter(paths)
+    with ThreadPoolExecutor(max_workers=window) as readers, ProcessPoolExecutor(max_workers=jobs) as ex:
+        reads = deque((p, readers.submit(_read_or_none, p)) for p in islice(it, window))
+        pending = deque()
+        while reads:
+            path, fut = reads.popleft()
+            pending.append(ex.submit(worker, path, data=fut.result()))
+            nxt = next(it, None)
+            if nxt is not None:
+                reads.append((nxt, readers.submit(_read_or_none, nxt)))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def positive_int(value: str) -> int:
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {n}")
+    return n
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="Strip EXIF/metadata from images under the photos/ directory.")
     parser.add_argument("--root", type=str, default="photos", help="Path to photos root (default: photos)")
     parser.add_argument("--dry-run", action="store_true", help="Don't write changes; just print what would happen")
     parser.add_argument("--backup", action="store_true", help="Save original files under a .originals/ folder in each album")
-    parser.add_argument("--quality", type=int, default=95, help="JPEG quality when re-saving (default: 95)")
+    parser.add_argument("--quality", type=int, default=None, help="JPEG quality when re-saving (default: reuse the source quantization tables)")
+    parser.add_argument("--optimize", action="store_true", help="Optimize JPEG Huffman tables when re-encoding (slower)")
+    parser.add_argument("--verbose", action="store_true", help="Print a line per file (errors are always printed)")
+    parser.add_argument("--jobs", type=positive_int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Reprocess files already marked as stripped")
+    parser.add_argument("--prefetch", action="store_true", help="Read files ahead on a thread pool while workers strip (helps on network shares)")
     args = parser.parse_args()
 
     root = Path(args.root).resolve()
@@ -119,19 +390,35 @@ def main() -> int:
         print(f"Root not found or not a directory: {root}", file=sys.stderr)
         return 1
 
+    paths = list(iter_image_files(root))
+    skipped = 0
+    if not args.force:
+        # Unchanged files from a previous run only cost a stat + getxattr
+        pending = [p for p in paths if not is_marked_stripped(p)]
+        skipped = len(paths) - len(pending)
+        paths = pending
+    worker = functools.partial(
+        strip_metadata, dry_run=args.dry_run, backup=args.backup, jpeg_quality=args.quality, optimize=args.optimize
+    )
+
     total = 0
     changed = 0
     errors = 0
-    for img_path in iter_image_files(root):
+    run = iter_prefetched if args.prefetch else iter_pooled
+    for path, (ok, msg) in zip(paths, run(paths, worker, args.jobs)):
         total += 1
-        ok, msg = strip_metadata(img_path, dry_run=args.dry_run, backup=args.backup, jpeg_quality=args.quality)
         if ok:
             changed += 1
+            if not args.dry_run:
+                mark_stripped(path)
         else:
             errors += 1
-        print(msg)
+        if args.verbose or args.dry_run or not ok:
+            print(msg)
+        elif total % 100 == 0:
+            print(f"... {total} processed", flush=True)
 
-    print(f"\nProcessed: {total}, changed: {changed}, errors: {errors}")
+    print(f"\nProcessed: {total}, changed: {changed}, errors: {errors}, skipped (already stripped): {skipped}")
     if args.dry_run:
         print("Dry run only. No files were modified.")
     return 0 if errors == 0 else 2